@@ -1,19 +1,60 @@
+import os
 import sqlite3
 import json
-from flask import Flask, jsonify, request, g
-from flask_cors import CORS
+import threading
+import orjson
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import JSONProvider
+
+
+class OrjsonProvider(JSONProvider):
+    """Routes jsonify and request JSON parsing through orjson."""
+
+    def dumps(self, obj, **kwargs):
+        # Sorted keys match the key order of Flask's default provider
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 # --- Configuration ---
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+app.json = OrjsonProvider(app)
 DATABASE = 'parking_system.db'
 
+# --- SQL Statements ---
+# Hot-path statements live at module scope so every call passes the same
+# string object and hits the connection's prepared-statement cache.
+
+SQL_ALL_SPOTS = 'SELECT spot_id, floor, spot_type, is_occupied FROM ParkingSpots ORDER BY spot_id'
+SQL_USER_INFO = 'SELECT user_id, role, is_premium FROM Users WHERE user_id = ?'
+SQL_USER_IS_PREMIUM = 'SELECT is_premium FROM Users WHERE user_id = ?'
+SQL_OCCUPY_SPOT = 'UPDATE ParkingSpots SET is_occupied = 1 WHERE spot_id = ?'
+SQL_FREE_SPOT = 'UPDATE ParkingSpots SET is_occupied = 0 WHERE spot_id = ?'
+
 # --- Database Initialization and Helpers ---
 
-def get_db_connection():
-    """Connects to the SQLite database."""
-    conn = sqlite3.connect(DATABASE)
+def connect_db():
+    """Opens a new, tuned connection to the SQLite database."""
+    conn = sqlite3.connect(DATABASE, isolation_level=None, cached_statements=256)
     conn.row_factory = sqlite3.Row  # This allows accessing columns by name
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA mmap_size=8388608')  # read DB pages straight from the page cache
+    return conn
+
+# One connection per server thread, kept open across requests so each thread
+# reuses its connection and prepared statements. WAL lets the threads read in
+# parallel while a write is in progress.
+_thread_local = threading.local()
+
+def get_db_connection():
+    """Returns this thread's connection, opening it on first use."""
+    conn = getattr(_thread_local, 'conn', None)
+    if conn is None:
+        conn = _thread_local.conn = connect_db()
     return conn
 
 def init_db():
@@ -21,13 +62,15 @@ def init_db():
     Initializes the database structure and mock data.
     This function deletes and recreates the tables on every restart.
     """
-    conn = get_db_connection()
+    conn = connect_db()
     cursor = conn.cursor()
 
+    # Rebuild everything in one write transaction (a single commit/fsync)
+    cursor.execute('BEGIN IMMEDIATE')
+
     # --- Drop tables to ensure a clean start ---
     cursor.execute('DROP TABLE IF EXISTS ParkingSpots')
     cursor.execute('DROP TABLE IF EXISTS Users')
-    conn.commit()
 
     # --- Create ParkingSpots Table (Requirement 1: List of all seats) ---
     cursor.execute('''
@@ -74,10 +117,11 @@ def init_db():
         is_occupied = 1 if i % 2 == 0 else 0
         spots_data.append((i, 'Parking 2', 'Standard', is_occupied))
     
-    # Insert spot data
-    cursor.executemany(
-        'INSERT INTO ParkingSpots (spot_id, floor, spot_type, is_occupied) VALUES (?, ?, ?, ?)',
-        spots_data
+    # Insert spot data (one multi-row INSERT: a single parse and bind pass)
+    cursor.execute(
+        'INSERT INTO ParkingSpots (spot_id, floor, spot_type, is_occupied) VALUES '
+        + ', '.join(['(?, ?, ?, ?)'] * len(spots_data)),
+        [value for row in spots_data for value in row]
     )
 
     # --- Mock Data for Users (Requirement 3: Premium users) ---
@@ -86,16 +130,193 @@ def init_db():
         (102, 'Student', 0),    # Standard Student
         (103, 'Premium Student', 1), # Premium Student
     ]
-    cursor.executemany(
-        'INSERT INTO Users (user_id, role, is_premium) VALUES (?, ?, ?)',
-        users_data
+    cursor.execute(
+        'INSERT INTO Users (user_id, role, is_premium) VALUES '
+        + ', '.join(['(?, ?, ?)'] * len(users_data)),
+        [value for row in users_data for value in row]
     )
 
     conn.commit()
+    load_spot_state(conn)
     conn.close()
     print("Database initialized with 20 spots and 3 users. Spots are reset.")
 
 
+# --- In-Memory Spot State ---
+# The spot table is tiny, so reads and allocation are served from memory.
+# Occupancy is one int bitmask where bit (spot_id - 1) is set when the spot is
+# occupied; spot types and floors are constant masks built at load time, so
+# searches and density are a few bitwise ops.
+# SQLite stays the source of truth: every mutation is written through to it.
+# The state is per process, so run a single worker process.
+
+SPOT_FRAGMENTS = None  # (bit, JSON object if free, JSON object if occupied) per spot, by spot_id
+OCC = 0             # occupancy bitmask
+SPOT_BITS = {}      # spot_id -> its bit
+ALLOCATION_PLANS = {}  # is premium user -> ordered (type mask, on target floor?, message) steps
+FLOORS = ()         # (floor name, mask of its spots, number of spots), sorted by name
+SPOTS_JSON = None   # cached /api/spots response body, rebuilt after a mutation
+
+# Serializes every read-modify-write of the state above, so two concurrent
+# requests can never pick (or free) the same spot.
+STATE_LOCK = threading.Lock()
+
+def load_spot_state(conn):
+    """Loads the spot table into the in-memory masks."""
+    global SPOT_FRAGMENTS, OCC, SPOT_BITS, ALLOCATION_PLANS, FLOORS, SPOTS_JSON
+    SPOT_FRAGMENTS = []
+    OCC = 0
+    SPOT_BITS = {}
+    type_masks = {'Standard': 0, 'Premium': 0}
+    floor_masks = {}
+    # Rows are unpacked positionally, skipping sqlite3.Row's by-name lookups
+    for spot_id, floor, spot_type, is_occupied in conn.execute(SQL_ALL_SPOTS).fetchall():
+        bit = 1 << (spot_id - 1)
+        SPOT_BITS[spot_id] = bit
+        type_masks[spot_type] |= bit
+        floor_masks[floor] = floor_masks.get(floor, 0) | bit
+        if is_occupied:
+            OCC |= bit
+        # Only is_occupied ever changes, so both possible encodings are prebuilt
+        SPOT_FRAGMENTS.append((bit, *(
+            orjson.dumps({
+                "spot_id": spot_id,
+                "floor": floor,
+                "spot_type": spot_type,
+                "is_occupied": occupied,
+            }, option=orjson.OPT_SORT_KEYS)
+            for occupied in (0, 1)
+        )))
+    FLOORS = tuple(
+        (floor, mask, mask.bit_count()) for floor, mask in sorted(floor_masks.items())
+    )
+    ALLOCATION_PLANS = build_allocation_plans(type_masks['Premium'], type_masks['Standard'])
+    SPOTS_JSON = None
+
+def build_allocation_plans(premium_mask, standard_mask):
+    """
+    Builds the allocation search order for each user tier, with the spot-type
+    masks baked in. Each step is (type mask, search the target floor?, message);
+    the first step with a free spot wins.
+    """
+    return {
+        True: (
+            # PREMIUM PRIORITY: best Premium spot on the LEAST DENSE floor
+            (premium_mask, True, "Allocated nearest Premium spot in {floor} (Least Dense)."),
+            # FALLBACK: best Standard spot on the LEAST DENSE floor
+            (standard_mask, True, "Premium spots in {floor} are full. Allocated nearest Standard spot."),
+            # OVERFLOW: the other floors, Premium first
+            (premium_mask, False, "Least dense area full. Allocated nearest available Premium spot."),
+            (standard_mask, False, "Least dense area full. Allocated nearest available Standard spot."),
+        ),
+        False: (
+            # STANDARD: best Standard spot on the LEAST DENSE floor, then the other floors
+            (standard_mask, True, "Allocated nearest Standard spot in {floor}."),
+            (standard_mask, False, "Least dense area full. Allocated nearest available Standard spot."),
+        ),
+    }
+
+def ensure_spot_state():
+    """Loads the in-memory state on first use (e.g. under Gunicorn, which skips init_db)."""
+    if SPOT_FRAGMENTS is None:
+        with STATE_LOCK:
+            if SPOT_FRAGMENTS is None:
+                load_spot_state(get_db_connection())
+
+def set_occupied(spot_id, is_occupied):
+    """Updates one spot in memory and invalidates the cached spot list."""
+    global OCC, SPOTS_JSON
+    if is_occupied:
+        OCC |= SPOT_BITS[spot_id]
+    else:
+        OCC &= ~SPOT_BITS[spot_id]
+    SPOTS_JSON = None
+
+def get_spots_json():
+    """Returns the serialized /api/spots payload, rebuilding it only after a mutation."""
+    global SPOTS_JSON
+    spots_json = SPOTS_JSON
+    if spots_json is None:
+        # Rebuild under the lock so a concurrent mutation cannot leave a stale body cached
+        with STATE_LOCK:
+            if SPOTS_JSON is None:
+                SPOTS_JSON = b'[' + b','.join(
+                    occupied_json if OCC & bit else free_json
+                    for bit, free_json, occupied_json in SPOT_FRAGMENTS
+                ) + b']'
+            spots_json = SPOTS_JSON
+    return spots_json
+
+def get_least_dense_floor(occ):
+    """
+    Determines the floor ('Parking 1' or 'Parking 2') with the lowest occupancy density.
+    Ties go to the first floor by name. Returns (floor name, floor mask).
+    """
+    best_floor = best_mask = None
+    best_occupied = best_total = 0
+    for floor, mask, total in FLOORS:
+        occupied = (occ & mask).bit_count()
+        # occupied / total < best_occupied / best_total, without float division
+        if best_floor is None or occupied * best_total < best_occupied * total:
+            best_floor, best_mask = floor, mask
+            best_occupied, best_total = occupied, total
+    return best_floor, best_mask
+
+def lowest_spot(candidates):
+    """Returns the nearest (lowest) spot_id in a candidate mask, or None if it is empty."""
+    if not candidates:
+        return None
+    # The lowest set bit is the lowest spot_id; its bit_length() is that id.
+    return (candidates & -candidates).bit_length()
+
+
+def pick_spot(is_premium):
+    """
+    Chooses the spot for a user from the in-memory state.
+    Returns (spot_id, message), or (None, "") when no suitable spot is free.
+    Must be called with STATE_LOCK held.
+    """
+    # --- Allocation Logic: Determine Target Floor ---
+    occ = OCC
+    target_floor, target_mask = get_least_dense_floor(occ)
+
+    # Free spots on the target floor, and on every other floor for the overflow search
+    free = ~occ
+    target_free = free & target_mask
+    overflow_free = free & ~target_mask
+
+    for type_mask, on_target_floor, message in ALLOCATION_PLANS[is_premium == 1]:
+        spot_id = lowest_spot((target_free if on_target_floor else overflow_free) & type_mask)
+        if spot_id is not None:
+            return spot_id, message.format(floor=target_floor)
+    return None, ""
+
+
+# --- Request Helpers ---
+
+def read_int_field(field):
+    """
+    Reads an integer field from the JSON request body.
+    Returns the int (0 included), or None if it is missing or not an integer.
+    """
+    # cache=False: the body is read once, so skip storing the parsed result
+    data = request.get_json(cache=False)
+    value = data.get(field) if isinstance(data, dict) else None
+    # bool is an int subclass, but true/false is not a valid ID
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    return value
+
+# Success bodies have a fixed schema, so they are filled in from byte templates
+# instead of going through jsonify (keys in jsonify's sorted order).
+ALLOCATE_OK_TEMPLATE = b'{"allocated_spot_id":%d,"message":%s,"success":true}'
+RELEASE_OK_TEMPLATE = b'{"message":"Spot %d released.","success":true}'
+
+def json_response(body):
+    """Wraps an already-serialized JSON body in a response."""
+    return Response(body, mimetype='application/json')
+
+
 # --- API Endpoints ---
 
 # FIX: Added Root Route to prevent 404 error on the main URL
@@ -112,25 +333,19 @@ def index():
 @app.route('/api/spots', methods=['GET'])
 def get_spots():
     """API to list all seats and their current status."""
-    conn = get_db_connection()
-    spots = conn.execute('SELECT * FROM ParkingSpots').fetchall()
-    conn.close()
-    
-    # Convert Row objects to list of dictionaries
-    spots_list = [dict(spot) for spot in spots]
-    return jsonify(spots_list)
+    ensure_spot_state()
+    return json_response(get_spots_json())
 
 @app.route('/api/user_info', methods=['POST'])
 def get_user_info():
     """API to look up user role and premium status for login."""
     try:
-        user_id = request.json.get('user_id')
+        user_id = read_int_field('user_id')
         if user_id is None:
             return jsonify({"success": False, "error": "User ID is required"}), 400
 
         conn = get_db_connection()
-        user = conn.execute('SELECT user_id, role, is_premium FROM Users WHERE user_id = ?', (user_id,)).fetchone()
-        conn.close()
+        user = conn.execute(SQL_USER_INFO, (user_id,)).fetchone()
 
         if user:
             return jsonify({
@@ -146,47 +361,6 @@ def get_user_info():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-def get_least_dense_floor(cursor):
-    """
-    Determines the floor ('Parking 1' or 'Parking 2') with the lowest occupancy density.
-    Returns the floor name string.
-    """
-    
-    # Get total and occupied counts for each floor
-    cursor.execute("""
-        SELECT 
-            floor,
-            SUM(CASE WHEN is_occupied = 1 THEN 1 ELSE 0 END) as occupied_count,
-            COUNT(spot_id) as total_count
-        FROM ParkingSpots
-        GROUP BY floor
-    """)
-    floor_data = cursor.fetchall()
-
-    density_map = {}
-    
-    for row in floor_data:
-        floor = row['floor']
-        occupied = row['occupied_count']
-        total = row['total_count']
-        
-        # Calculate density (handle division by zero if needed, though unlikely here)
-        density = occupied / total if total > 0 else 1.0
-        density_map[floor] = density
-
-    # Find the floor with the minimum density
-    # Default to 'Parking 1' if density is equal or data is missing
-    least_dense_floor = 'Parking 1' 
-    min_density = density_map.get('Parking 1', 1.0) # Start with P1 density
-
-    # Compare densities
-    p2_density = density_map.get('Parking 2', 1.0)
-    
-    if p2_density < min_density:
-        least_dense_floor = 'Parking 2'
-        
-    return least_dense_floor
-
 @app.route('/api/allocate', methods=['POST'])
 def allocate_spot():
     """
@@ -194,158 +368,103 @@ def allocate_spot():
     Uses Density-Based Allocation: find the least dense parking area first,
     then allocate the nearest spot within that area, respecting Premium status.
     """
-    data = request.json
-    user_id = data.get('user_id')
+    user_id = read_int_field('user_id')
 
-    if not user_id:
+    if user_id is None:
         return jsonify({"error": "User ID is required"}), 400
 
     conn = get_db_connection()
-    cursor = conn.cursor()
 
     # 1. Get user status
-    user = cursor.execute('SELECT is_premium FROM Users WHERE user_id = ?', (user_id,)).fetchone()
+    user = conn.execute(SQL_USER_IS_PREMIUM, (user_id,)).fetchone()
     if not user:
-        conn.close()
         return jsonify({"error": "Invalid User ID."}), 404
     
     is_premium = user['is_premium']
-    
-    allocated_spot_id = None
-    query_message = ""
-    
-    # --- Allocation Logic: Determine Target Floor ---
-    target_floor = get_least_dense_floor(cursor)
-    
-    # 2. PREMIUM PRIORITY: Try to find the best available Premium spot on the LEAST DENSE floor
-    if is_premium == 1:
-        query_premium = """
-            SELECT spot_id FROM ParkingSpots 
-            WHERE floor = ? AND spot_type = 'Premium' AND is_occupied = 0 
-            ORDER BY spot_id ASC LIMIT 1
-        """
-        premium_spot = cursor.execute(query_premium, (target_floor,)).fetchone()
-        
-        if premium_spot:
-            allocated_spot_id = premium_spot['spot_id']
-            query_message = f"Allocated nearest Premium spot in {target_floor} (Least Dense)."
-
-    # 3. STANDARD/FALLBACK PRIORITY: Find the best available Standard spot on the LEAST DENSE floor
-    if allocated_spot_id is None:
-        query_standard = """
-            SELECT spot_id FROM ParkingSpots 
-            WHERE floor = ? AND spot_type = 'Standard' AND is_occupied = 0 
-            ORDER BY spot_id ASC LIMIT 1
-        """
-        standard_spot = cursor.execute(query_standard, (target_floor,)).fetchone()
-        
-        if standard_spot:
-            allocated_spot_id = standard_spot['spot_id']
-            query_message = f"Allocated nearest Standard spot in {target_floor}."
-            if is_premium == 1:
-                query_message = f"Premium spots in {target_floor} are full. Allocated nearest Standard spot."
-    
-    # 4. OVERFLOW FALLBACK: If the least dense area is full or lacks the right spot type, search the entire system
-    if allocated_spot_id is None:
-        # Re-run the allocation search, but this time without filtering by floor
-        
-        if is_premium == 1:
-            # Check for ANY available Premium spot (even on the dense floor)
-            query_premium_any = """
-                SELECT spot_id FROM ParkingSpots 
-                WHERE spot_type = 'Premium' AND is_occupied = 0 
-                ORDER BY spot_id ASC LIMIT 1
-            """
-            premium_spot_any = cursor.execute(query_premium_any).fetchone()
-            if premium_spot_any:
-                allocated_spot_id = premium_spot_any['spot_id']
-                query_message = "Least dense area full. Allocated nearest available Premium spot."
+
+    ensure_spot_state()
+
+    with STATE_LOCK:
+        allocated_spot_id, query_message = pick_spot(is_premium)
 
         if allocated_spot_id is None:
-            # Check for ANY available Standard spot (for everyone)
-            query_standard_any = """
-                SELECT spot_id FROM ParkingSpots 
-                WHERE spot_type = 'Standard' AND is_occupied = 0 
-                ORDER BY spot_id ASC LIMIT 1
-            """
-            standard_spot_any = cursor.execute(query_standard_any).fetchone()
-            if standard_spot_any:
-                allocated_spot_id = standard_spot_any['spot_id']
-                query_message = "Least dense area full. Allocated nearest available Standard spot."
-
-
-    # --- Execute Update ---
-    
-    if allocated_spot_id is not None:
-        # Mark the spot as occupied
-        cursor.execute(
-            "UPDATE ParkingSpots SET is_occupied = 1 WHERE spot_id = ?",
-            (allocated_spot_id,)
-        )
+            return jsonify({"error": "All spots are currently occupied."}), 409
+
+        # --- Execute Update (write-through) ---
+
+        conn.execute(SQL_OCCUPY_SPOT, (allocated_spot_id,))
         conn.commit()
-        
-        conn.close()
-        return jsonify({
-            "success": True, 
-            "allocated_spot_id": allocated_spot_id, 
-            "message": query_message
-        })
-    else:
-        conn.close()
-        return jsonify({"error": "All spots are currently occupied."}), 409
+        set_occupied(allocated_spot_id, 1)
+
+    # The message is encoded with orjson so it is always a valid JSON string
+    return json_response(ALLOCATE_OK_TEMPLATE % (allocated_spot_id, orjson.dumps(query_message)))
 
 
 @app.route('/api/release', methods=['POST'])
 def release_spot():
     """API to mark a spot as free (checkout)."""
-    data = request.json
-    spot_id = data.get('spot_id')
+    spot_id = read_int_field('spot_id')
 
-    if not spot_id:
+    if spot_id is None:
         return jsonify({"error": "Spot ID is required"}), 400
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     try:
-        # Check if spot is currently occupied
-        spot = cursor.execute('SELECT is_occupied FROM ParkingSpots WHERE spot_id = ?', (spot_id,)).fetchone()
-        
-        if spot is None:
-            return jsonify({"error": f"Spot ID {spot_id} does not exist."}), 404
-        
-        if spot['is_occupied'] == 0:
-            return jsonify({"error": f"Spot {spot_id} is already free."}), 409
-
-        # Mark the spot as free
-        cursor.execute(
-            "UPDATE ParkingSpots SET is_occupied = 0 WHERE spot_id = ?",
-            (spot_id,)
-        )
-        conn.commit()
-        return jsonify({"success": True, "message": f"Spot {spot_id} released."})
+        ensure_spot_state()
+
+        with STATE_LOCK:
+            # Check if spot is currently occupied
+            bit = SPOT_BITS.get(spot_id)
+
+            if bit is None:
+                return jsonify({"error": f"Spot ID {spot_id} does not exist."}), 404
+
+            if not OCC & bit:
+                return jsonify({"error": f"Spot {spot_id} is already free."}), 409
+
+            # Mark the spot as free (write-through)
+            conn = get_db_connection()
+            conn.execute(SQL_FREE_SPOT, (spot_id,))
+            conn.commit()
+            set_occupied(spot_id, 0)
+
+        return json_response(RELEASE_OK_TEMPLATE % spot_id)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
 
 # --- Application Setup ---
 
-@app.teardown_appcontext
-def close_connection(exception):
-    """Closes the database connection at the end of the request."""
-    db = getattr(g, '_database', None)
-    if db is not None:
-        db.close()
+# The dashboard (index.html) is hosted separately and calls every /api/ endpoint
+# cross-origin; its JSON POSTs are preflighted with OPTIONS.
+CORS_HEADERS = (('Access-Control-Allow-Origin', '*'),)
+CORS_PREFLIGHT_HEADERS = (
+    ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type'),
+)
+
+@app.after_request
+def add_cors_headers(response):
+    """Adds CORS headers to API responses."""
+    if request.path.startswith('/api/'):
+        response.headers.extend(CORS_HEADERS)
+        if request.method == 'OPTIONS':
+            response.headers.extend(CORS_PREFLIGHT_HEADERS)
+    return response
 
 if __name__ == '__main__':
     # Initialize the database and reset spot status for local development
     init_db()
     
-    print("--- Starting Flask Server ---")
+    print("--- Starting Server ---")
     print("Visit http://127.0.0.1:5000/ to test the root endpoint.")
     
-    # Run the server (Note: Render uses Gunicorn, which replaces this)
-    app.run(debug=True)
+    # Run the server (Note: Render uses Gunicorn, which replaces this; keep it to
+    # a single process since spot state lives in memory, e.g.
+    # `gunicorn --workers 1 --threads 8 app:app`)
+    if os.environ.get('FLASK_ENV') == 'dev':
+        # Flask dev server with the reloader and debugger: FLASK_ENV=dev python app.py
+        app.run(debug=True)
+    else:
+        from waitress import serve
+        serve(app, host='127.0.0.1', port=5000, threads=8)